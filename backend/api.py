@@ -6,7 +6,7 @@ Uses rio-tiler for efficient tile generation from Cloud Optimized GeoTIFFs
 from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from rio_tiler.io import Reader
-from rio_tiler.colormap import cmap
+from rio_tiler.errors import TileOutsideBounds
 from rio_tiler.models import ImageData
 import numpy as np
 from typing import Optional
@@ -15,9 +15,10 @@ from cog_registry import COG_URLS, LAND_COVER_CLASSES, TREE_CLASSES
 from PIL import Image
 from io import BytesIO
 from functools import lru_cache
-import hashlib
+from collections import OrderedDict
+import threading
+import asyncio
 from pathlib import Path
-import os
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -31,6 +32,34 @@ logger.info(f"Tile cache directory: {CACHE_DIR.absolute()}")
 # Memory cache size (number of tiles to keep in memory)
 MEMORY_CACHE_SIZE = 500
 
+# Memory budget (bytes) for cached area reads (coverage/visualization) per worker;
+# a 4096px polygon read alone is up to 16MB, so the cache is bounded by size
+PART_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_part_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+_part_cache_bytes = 0
+_part_cache_lock = threading.Lock()
+
+# Longest side (pixels) for rectangle coverage and visualization reads,
+# ~0.35m/pixel over the study area
+AREA_MAX_SIZE = 2048
+
+# Polygon coverage reads near native resolution (6in for 2021) so the masked
+# percentage stays accurate
+POLYGON_COVERAGE_MAX_SIZE = 4096
+
+def _encode_transparent_tile() -> bytes:
+    """Encode the fully transparent tile served for out-of-bounds requests"""
+    buf = BytesIO()
+    Image.new('RGBA', (256, 256), (0, 0, 0, 0)).save(buf, format='PNG', optimize=True)
+    return buf.getvalue()
+
+# Out-of-bounds tiles are all identical, so encode once at startup
+TRANSPARENT_TILE_BYTES = _encode_transparent_tile()
+
+# Cache-Control for tiles that will never change vs. placeholders served after a read error
+TILE_CACHE_CONTROL = "public, max-age=2592000"  # 30 days
+TILE_ERROR_CACHE_CONTROL = "no-store"
+
 # COG Reader connection pool (keeps connections alive)
 @lru_cache(maxsize=10)
 def get_cog_reader(cog_url: str):
@@ -40,6 +69,49 @@ def get_cog_reader(cog_url: str):
     """
     return Reader(cog_url)
 
+def read_cog_part(year: int, bbox: tuple, max_size: int) -> np.ndarray:
+    """
+    Read class data for a bounding box (with memory cache)
+    Repeated coverage/visualization requests for the same area skip the COG read;
+    the least recently used reads are dropped once PART_CACHE_MAX_BYTES is exceeded
+    
+    Runs in worker threads (see _read_cog_part_async), so it opens its own
+    Reader rather than sharing the tile endpoint's dataset handle
+    
+    Returns:
+        Read-only 2D uint8 array of class values
+    """
+    global _part_cache_bytes
+    key = (year, bbox, max_size)
+    with _part_cache_lock:
+        data = _part_cache.get(key)
+        if data is not None:
+            _part_cache.move_to_end(key)
+            return data
+    
+    with Reader(COG_URLS[year]) as cog:
+        img: ImageData = cog.part(bbox=list(bbox), max_size=max_size)
+    # Class codes fit in a byte; uint8 keeps cached reads small and bincount fast
+    data = img.data[0].astype(np.uint8, copy=False)
+    data.flags.writeable = False  # Shared between requests
+    
+    if data.nbytes <= PART_CACHE_MAX_BYTES:
+        with _part_cache_lock:
+            if key not in _part_cache:
+                _part_cache[key] = data
+                _part_cache_bytes += data.nbytes
+            while _part_cache_bytes > PART_CACHE_MAX_BYTES:
+                _, evicted = _part_cache.popitem(last=False)
+                _part_cache_bytes -= evicted.nbytes
+    return data
+
+async def _read_cog_part_async(year: int, bbox: tuple, max_size: int) -> np.ndarray:
+    """
+    read_cog_part off the event loop, so concurrent area requests (the app
+    fetches both years at once) overlap their COG reads instead of queuing
+    """
+    return await asyncio.to_thread(read_cog_part, year, bbox, max_size)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Tree Cover Analysis Tile Server",
@@ -79,59 +151,98 @@ def create_tree_colormap():
 def get_tile_cache_path(year: int, z: int, x: int, y: int) -> Path:
     """Get the file path for a cached tile"""
     # Organize cache by year and zoom level
-    cache_subdir = CACHE_DIR / str(year) / str(z) / str(x)
-    cache_subdir.mkdir(parents=True, exist_ok=True)
-    return cache_subdir / f"{y}.png"
+    return CACHE_DIR / str(year) / str(z) / str(x) / f"{y}.png"
 
 
 @lru_cache(maxsize=MEMORY_CACHE_SIZE)
+def read_cached_tile(year: int, z: int, x: int, y: int) -> bytes:
+    """
+    Read a cached tile from disk (with memory cache)
+    Raises FileNotFoundError if not cached, so misses are never memoized
+    """
+    with open(get_tile_cache_path(year, z, x, y), 'rb') as f:
+        return f.read()
+
+
 def get_cached_tile_bytes(year: int, z: int, x: int, y: int) -> Optional[bytes]:
     """
     Get cached tile from disk (with memory cache)
     Returns None if not cached
     """
-    cache_path = get_tile_cache_path(year, z, x, y)
-    if cache_path.exists():
-        try:
-            with open(cache_path, 'rb') as f:
-                return f.read()
-        except Exception as e:
-            logger.warning(f"Failed to read cache file {cache_path}: {e}")
-            return None
-    return None
+    try:
+        return read_cached_tile(year, z, x, y)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Failed to read cached tile {year}/{z}/{x}/{y}: {e}")
+        return None
 
 
 def save_tile_to_cache(year: int, z: int, x: int, y: int, tile_bytes: bytes):
     """Save generated tile to disk cache"""
     try:
         cache_path = get_tile_cache_path(year, z, x, y)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
         with open(cache_path, 'wb') as f:
             f.write(tile_bytes)
         # Also store in memory cache
-        get_cached_tile_bytes(year, z, x, y)  # This will cache it in LRU
+        read_cached_tile(year, z, x, y)  # This will cache it in LRU
     except Exception as e:
         logger.warning(f"Failed to save tile to cache: {e}")
 
 
-def apply_colormap(data: np.ndarray, colormap: dict) -> np.ndarray:
+@lru_cache(maxsize=1)
+def _tree_palette() -> tuple:
+    """
+    PNG palette (PLTE) and per-index alpha (tRNS) for the tree colormap
+    
+    Index = class value; values missing from the colormap stay transparent
+    
+    Returns:
+        (768 bytes of RGB, 256 bytes of alpha)
+    """
+    rgba = np.zeros((256, 4), dtype=np.uint8)
+    for class_id, color in create_tree_colormap().items():
+        rgba[class_id] = color
+    return rgba[:, :3].tobytes(), rgba[:, 3].tobytes()
+
+
+def encode_class_png(data: np.ndarray) -> bytes:
     """
-    Apply a colormap to classification data
+    Encode classification data as an 8-bit palette PNG with the tree colormap
+    
+    Class values are the palette indices, so no RGBA image is built and the
+    PNG stores one byte per pixel
     
     Args:
         data: 2D numpy array with class values (0-8)
-        colormap: dict mapping class_id -> [R, G, B, A]
     
     Returns:
-        4D RGBA image array (height, width, 4)
+        PNG bytes
     """
-    height, width = data.shape
-    rgba = np.zeros((height, width, 4), dtype=np.uint8)
+    rgb, alpha = _tree_palette()
+    img_pil = Image.fromarray(data.astype(np.uint8, copy=False), mode='P')
+    img_pil.putpalette(rgb)
     
-    for class_id, color in colormap.items():
-        mask = data == class_id
-        rgba[mask] = color
+    buf = BytesIO()
+    img_pil.save(buf, format='PNG', optimize=True, transparency=alpha)
+    return buf.getvalue()
+
+
+def count_tree_pixels(data: np.ndarray) -> tuple:
+    """
+    Count valid and tree pixels in a single pass over the data
     
-    return rgba
+    Args:
+        data: numpy array of class values (0 = nodata)
+    
+    Returns:
+        (valid_pixels, tree_pixels)
+    """
+    counts = np.bincount(data.ravel(), minlength=max(TREE_CLASSES) + 1)
+    valid_pixels = int(counts.sum() - counts[0])  # Exclude nodata
+    tree_pixels = int(counts[TREE_CLASSES].sum())
+    return valid_pixels, tree_pixels
 
 
 @app.get("/")
@@ -169,7 +280,7 @@ async def cache_stats():
         "total_tiles": total_tiles,
         "total_size_mb": round(total_size_mb, 2),
         "cache_dir": str(CACHE_DIR.absolute()),
-        "memory_cache_info": get_cached_tile_bytes.cache_info()._asdict()
+        "memory_cache_info": read_cached_tile.cache_info()._asdict()
     }
 
 
@@ -183,7 +294,7 @@ async def clear_cache():
             CACHE_DIR.mkdir(exist_ok=True)
         
         # Clear memory cache
-        get_cached_tile_bytes.cache_clear()
+        read_cached_tile.cache_clear()
         
         return {
             "status": "success",
@@ -223,7 +334,7 @@ async def get_tile(year: int, z: int, x: int, y: int, colormap_name: Optional[st
                 content=cached_bytes,
                 media_type="image/png",
                 headers={
-                    "Cache-Control": "public, max-age=2592000",  # 30 days
+                    "Cache-Control": TILE_CACHE_CONTROL,
                     "Access-Control-Allow-Origin": "*",
                     "X-Cache": "HIT"
                 }
@@ -242,18 +353,8 @@ async def get_tile(year: int, z: int, x: int, y: int, colormap_name: Optional[st
             # Get the classification data (first band)
             data = img.data[0]  # Shape: (height, width)
             
-            # Apply tree colormap
-            tree_colormap = create_tree_colormap()
-            rgba_data = apply_colormap(data, tree_colormap)
-            
-            # Convert to PIL Image
-            img_pil = Image.fromarray(rgba_data, mode='RGBA')
-            
-            # Save to bytes
-            buf = BytesIO()
-            img_pil.save(buf, format='PNG', optimize=True)
-            buf.seek(0)
-            tile_bytes = buf.getvalue()
+            # Encode with the tree colormap as a palette PNG
+            tile_bytes = encode_class_png(data)
             
             # Save to cache for next time
             save_tile_to_cache(year, z, x, y, tile_bytes)
@@ -262,25 +363,39 @@ async def get_tile(year: int, z: int, x: int, y: int, colormap_name: Optional[st
                 content=tile_bytes,
                 media_type="image/png",
                 headers={
-                    "Cache-Control": "public, max-age=2592000",  # 30 days
+                    "Cache-Control": TILE_CACHE_CONTROL,
                     "Access-Control-Allow-Origin": "*",
                     "X-Cache": "MISS"
                 }
             )
             
-        except Exception as tile_error:
-            logger.warning(f"Tile outside bounds or no data: {tile_error}")
-            # Return transparent tile for out-of-bounds requests
-            transparent = Image.new('RGBA', (256, 256), (0, 0, 0, 0))
-            buf = BytesIO()
-            transparent.save(buf, format='PNG')
-            buf.seek(0)
-            tile_bytes = buf.getvalue()
+        except TileOutsideBounds:
+            # Genuinely empty: cache the transparent tile like any other (saves network requests)
+            save_tile_to_cache(year, z, x, y, TRANSPARENT_TILE_BYTES)
             
-            # Cache transparent tiles too (saves network requests)
-            save_tile_to_cache(year, z, x, y, tile_bytes)
+            return Response(
+                content=TRANSPARENT_TILE_BYTES,
+                media_type="image/png",
+                headers={
+                    "Cache-Control": TILE_CACHE_CONTROL,
+                    "Access-Control-Allow-Origin": "*",
+                    "X-Cache": "MISS"
+                }
+            )
             
-            return Response(content=tile_bytes, media_type="image/png")
+        except Exception as tile_error:
+            # Possibly transient (network, COG read): serve a placeholder but let
+            # neither the disk cache nor the browser keep it
+            logger.warning(f"Tile read failed, serving uncached transparent tile: {tile_error}")
+            return Response(
+                content=TRANSPARENT_TILE_BYTES,
+                media_type="image/png",
+                headers={
+                    "Cache-Control": TILE_ERROR_CACHE_CONTROL,
+                    "Access-Control-Allow-Origin": "*",
+                    "X-Cache": "ERROR"
+                }
+            )
         
     except HTTPException:
         raise
@@ -319,20 +434,9 @@ async def get_preview(year: int, width: int = 512, height: int = 512):
         img: ImageData = cog.preview(width=width, height=height)
         data = img.data[0]
         
-        # Apply colormap
-        tree_colormap = create_tree_colormap()
-        rgba_data = apply_colormap(data, tree_colormap)
-        
-        # Convert to PIL Image
-        img_pil = Image.fromarray(rgba_data, mode='RGBA')
-        
-        # Save to bytes
-        buf = BytesIO()
-        img_pil.save(buf, format='PNG', optimize=True)
-        buf.seek(0)
-        
+        # Encode with the tree colormap as a palette PNG
         return Response(
-            content=buf.getvalue(),
+            content=encode_class_png(data),
             media_type="image/png",
             headers={"Cache-Control": "public, max-age=3600"}
         )
@@ -404,22 +508,15 @@ async def calculate_coverage(
         if year not in COG_URLS:
             raise HTTPException(status_code=404, detail=f"Year {year} not found")
         
-        cog_url = COG_URLS[year]
-        
-        # Use pooled reader
-        cog = get_cog_reader(cog_url)
-        
         # Read data for bounding box
-        img: ImageData = cog.part(
-            bbox=[west, south, east, north],
-            max_size=2048  # Limit resolution for performance
+        data = await _read_cog_part_async(
+            year,
+            (west, south, east, north),
+            max_size=AREA_MAX_SIZE
         )
         
-        data = img.data[0]
-        
         # Calculate tree coverage
-        valid_pixels = np.sum(data > 0)  # Exclude nodata
-        tree_pixels = np.sum(np.isin(data, TREE_CLASSES))
+        valid_pixels, tree_pixels = count_tree_pixels(data)
         
         coverage_percent = (tree_pixels / valid_pixels * 100) if valid_pixels > 0 else 0.0
         
@@ -438,7 +535,7 @@ async def calculate_coverage(
 
 
 from pydantic import BaseModel
-from typing import List, Tuple
+from typing import List
 
 class PolygonRequest(BaseModel):
     """Request body for polygon-based operations"""
@@ -472,10 +569,7 @@ async def calculate_polygon_coverage(year: int, polygon: PolygonRequest):
         
         from rasterio.features import geometry_mask
         from shapely.geometry import Polygon, mapping
-        import rasterio
-        from rasterio.warp import transform_bounds
         
-        cog_url = COG_URLS[year]
         coords = polygon.coordinates
         
         logger.info(f"Calculating polygon coverage for year {year} with {len(coords)} vertices")
@@ -486,17 +580,13 @@ async def calculate_polygon_coverage(year: int, polygon: PolygonRequest):
         # Get bounding box for initial data read
         minx, miny, maxx, maxy = poly.bounds
         
-        # Use pooled reader
-        cog = get_cog_reader(cog_url)
-        
         # Read data for bounding box
-        img: ImageData = cog.part(
-            bbox=[minx, miny, maxx, maxy],
-            max_size=4096  # Higher resolution for polygon
+        data = await _read_cog_part_async(
+            year,
+            (minx, miny, maxx, maxy),
+            max_size=POLYGON_COVERAGE_MAX_SIZE
         )
         
-        data = img.data[0]
-        
         # Create mask from polygon
         # We need to transform polygon to pixel coordinates
         height, width = data.shape
@@ -517,8 +607,7 @@ async def calculate_polygon_coverage(year: int, polygon: PolygonRequest):
         masked_data = data[mask]
         
         # Calculate tree coverage
-        valid_pixels = np.sum(masked_data > 0)  # Exclude nodata
-        tree_pixels = np.sum(np.isin(masked_data, TREE_CLASSES))
+        valid_pixels, tree_pixels = count_tree_pixels(masked_data)
         
         coverage_percent = (tree_pixels / valid_pixels * 100) if valid_pixels > 0 else 0.0
         
@@ -561,9 +650,6 @@ async def get_polygon_visualization(year: int, bounds: BoundsRequest):
         from rasterio.features import geometry_mask
         from rasterio.transform import from_bounds
         
-        cog_url = COG_URLS[year]
-        cog = get_cog_reader(cog_url)
-        
         # Determine bounds based on type
         if bounds.type == "polygon" and bounds.coordinates:
             coords = bounds.coordinates
@@ -578,12 +664,11 @@ async def get_polygon_visualization(year: int, bounds: BoundsRequest):
             logger.info(f"Generating rectangle visualization for year {year}")
         
         # Read data for bounding box
-        img: ImageData = cog.part(
-            bbox=[minx, miny, maxx, maxy],
-            max_size=2048  # Good resolution for visualization
+        data = await _read_cog_part_async(
+            year,
+            (minx, miny, maxx, maxy),
+            max_size=AREA_MAX_SIZE
         )
-        
-        data = img.data[0]
         height, width = data.shape
         
         # Apply polygon mask if needed
@@ -598,34 +683,16 @@ async def get_polygon_visualization(year: int, bounds: BoundsRequest):
         else:
             mask = np.ones((height, width), dtype=bool)  # All valid
         
-        # Create RGBA visualization
-        rgba = np.zeros((height, width, 4), dtype=np.uint8)
-        
-        # Apply tree colormap with polygon mask
-        tree_colormap = create_tree_colormap()
-        for class_id, color in tree_colormap.items():
-            class_mask = (data == class_id) & mask
-            rgba[class_mask] = color
-        
-        # Set areas outside polygon to transparent
-        rgba[~mask] = [0, 0, 0, 0]
-        
-        # Convert to PIL Image
-        img_pil = Image.fromarray(rgba, mode='RGBA')
-        
-        # Save to bytes
-        buf = BytesIO()
-        img_pil.save(buf, format='PNG', optimize=True)
-        buf.seek(0)
+        # Palette PNG; areas outside the polygon become nodata (transparent)
+        png_bytes = encode_class_png(np.where(mask, data, 0))
         
         # Calculate coverage stats
         masked_data = data[mask]
-        valid_pixels = np.sum(masked_data > 0)
-        tree_pixels = np.sum(np.isin(masked_data, TREE_CLASSES))
+        valid_pixels, tree_pixels = count_tree_pixels(masked_data)
         coverage = (tree_pixels / valid_pixels * 100) if valid_pixels > 0 else 0.0
         
         return Response(
-            content=buf.getvalue(),
+            content=png_bytes,
             media_type="image/png",
             headers={
                 "Cache-Control": "public, max-age=3600",
@@ -679,6 +746,53 @@ async def calculate_bounds_coverage(year: int, bounds: BoundsRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _coverage_read_args(bounds: BoundsRequest) -> tuple:
+    """(bbox, max_size) the coverage calculation calls read_cog_part with for these bounds"""
+    if bounds.type == "polygon" and bounds.coordinates:
+        from shapely.geometry import Polygon
+        return Polygon(bounds.coordinates).bounds, POLYGON_COVERAGE_MAX_SIZE
+    return (bounds.west, bounds.south, bounds.east, bounds.north), AREA_MAX_SIZE
+
+
+class MultiYearBoundsRequest(BoundsRequest):
+    """Request body for computing coverage of one area across several years"""
+    years: List[int]
+
+
+@app.post("/coverage/bounds")
+async def calculate_bounds_coverage_multi(request: MultiYearBoundsRequest):
+    """
+    Calculate tree coverage for several years in one request
+    
+    Args:
+        request: BoundsRequest fields plus the list of years
+    
+    Returns:
+        {"results": {year: coverage statistics or {"error": detail}}}
+    """
+    # Read every year's raster concurrently in worker threads to warm
+    # read_cog_part; the per-year calculations below then hit the memory cache
+    try:
+        bbox, max_size = _coverage_read_args(request)
+    except Exception:
+        bbox = None  # Invalid geometry is reported by the per-year calculation
+    if bbox is not None:
+        await asyncio.gather(
+            *(_read_cog_part_async(year, bbox, max_size)
+              for year in request.years if year in COG_URLS),
+            return_exceptions=True  # Read failures are reported the same way
+        )
+    
+    results = {}
+    for year in request.years:
+        try:
+            results[str(year)] = await calculate_bounds_coverage(year, request)
+        except HTTPException as e:
+            results[str(year)] = {"error": e.detail}
+    
+    return {"results": results}
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -11,8 +11,9 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 BACKEND_URL = "http://localhost:8000"
 YEARS = [2010, 2021]
 
-# Hudson Square area - common zoom levels
-ZOOM_LEVELS = [13, 14, 15, 16]  # Most commonly viewed
+# Hudson Square area - common zoom levels, through the street-level zooms
+# the map settles on after fitting the study area (a few dozen tiles at z18)
+ZOOM_LEVELS = [13, 14, 15, 16, 17, 18]
 
 def latlon_to_tile(lat, lon, zoom):
     """Convert lat/lon to tile coordinates"""
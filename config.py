@@ -5,7 +5,7 @@ Reads from Streamlit secrets when available, falls back to environment variables
 """
 
 import os
-from typing import Dict, Any
+from typing import Dict, Any, NamedTuple
 
 # Try to import streamlit for secrets access
 try:
@@ -56,12 +56,26 @@ DATABASE_CONFIGS = {
 ACTIVE_DB = _get_secret("database.active_db", "digitalocean")
 DATABASE_CONFIG = DATABASE_CONFIGS[ACTIVE_DB]
 
+# Per-process connection pool sizing; overridable via secrets or DATABASE_POOL_* env vars
+DATABASE_POOL_CONFIG = {
+    "min_connections": int(_get_secret("database.pool.min_connections", 1)),
+    "max_connections": int(_get_secret("database.pool.max_connections", 8)),
+    # Seconds to wait for a free connection before giving up
+    "wait_timeout": float(_get_secret("database.pool.wait_timeout", 5)),
+}
+
 # GCP Storage URLs for LiDAR datasets
 LIDAR_DATASETS = {
     "2010": "https://storage.googleapis.com/raster_datam/landcover_2010_nyc_05ft_cog.tif",
     "2021": "https://storage.googleapis.com/raster_datam/landcover_nyc_2021_6in_cog.tif"
 }
 
+# Published NYC Tree Canopy Assessment percentages, used when the data can't be read
+NYC_TREE_CANOPY_PERCENT = {
+    2010: 21.3,  # 5ft resolution
+    2021: 22.5   # 6in resolution
+}
+
 # Hudson Square study area bounds - 8-point polygon
 HUDSON_SQUARE_BOUNDS = {
     'type': 'polygon',
@@ -100,6 +114,17 @@ RASTER_CONFIG = {
     "nodata": 0
 }
 
+# GDAL options for reading remote COGs over HTTPS (pass to rasterio.Env)
+COG_ENV_OPTIONS = {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_INGESTED_BYTES_AT_OPEN": 16384,
+    "VSI_CACHE": "TRUE",
+    "VSI_CACHE_SIZE": 50_000_000
+}
+
 def get_database_url() -> str:
     """Generate database connection URL"""
     config = DATABASE_CONFIG
@@ -123,6 +148,32 @@ def get_study_area_bounds() -> Dict[str, float]:
         return HUDSON_SQUARE_BOUNDS.copy()
 
 
+class StudyArea(NamedTuple):
+    """Hudson Square bounding box with its derived values precomputed."""
+    west: float
+    east: float
+    north: float
+    south: float
+    center_lat: float
+    center_lon: float
+
+
+def _build_study_area() -> StudyArea:
+    bounds = get_study_area_bounds()
+    return StudyArea(
+        west=bounds['west'],
+        east=bounds['east'],
+        north=bounds['north'],
+        south=bounds['south'],
+        center_lat=(bounds['north'] + bounds['south']) / 2,
+        center_lon=(bounds['east'] + bounds['west']) / 2
+    )
+
+
+# Built once at import; the study area never changes at runtime
+STUDY_AREA = _build_study_area()
+
+
 def get_gcp_service_account() -> Dict[str, Any]:
     """
     Get GCP service account credentials from Streamlit secrets.
@@ -25,6 +25,16 @@ def main():
         print("❌ Failed to initialize database")
         return False
     
+    # Cluster and analyze here rather than at app startup, where the lock would block requests
+    print()
+    print("Step 2: Clustering and analyzing the pixel cache table...")
+    handler = PostGISRasterHandler()
+    if handler.connect():
+        try:
+            handler.maintain_pixel_cache()
+        finally:
+            handler.disconnect()
+    
     print()
     print("✅ Cache initialization complete!")
     print()
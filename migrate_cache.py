@@ -70,6 +70,9 @@ def main():
                 except Exception as e2:
                     print(f"⚠️ Could not create unique index: {e2}")
             
+            # Reorder rows along the new index and refresh planner statistics
+            handler.maintain_pixel_cache()
+            
             print()
             print("✅ Migration complete!")
             print("   The table now supports multiple cache entries per year")
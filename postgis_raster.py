@@ -3,16 +3,165 @@ PostGIS Raster Handler for Large LiDAR Datasets
 Provides cost-effective alternative to Google Earth Engine for hosting 77GB+ datasets
 """
 
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2
 import psycopg2.extras
-import rasterio
-import rasterio.warp
+import psycopg2.pool
 import numpy as np
-from typing import Tuple, Optional, Dict, Any
-import requests
-from io import BytesIO
+from typing import Tuple, Optional, Dict, Any, List
 import json
-from config import DATABASE_CONFIG, LIDAR_DATASETS, HUDSON_SQUARE_BOUNDS, get_study_area_bounds
+from config import DATABASE_CONFIG, DATABASE_POOL_CONFIG, LIDAR_DATASETS, HUDSON_SQUARE_BOUNDS, NYC_TREE_CANOPY_PERCENT, COG_ENV_OPTIONS, get_study_area_bounds
+
+
+# Idle opened COG handles per URL, checked out by one read at a time
+_COG_POOL_MAX_IDLE = 4
+_cog_pool: Dict[str, List[Any]] = {}
+_cog_pool_lock = threading.Lock()
+
+
+@contextmanager
+def _cog_dataset(url: str):
+    """
+    Check out an open handle for a remote COG so reads skip the header and overview requests.
+    A DatasetReader is not thread-safe, so each concurrent read gets its own handle;
+    up to _COG_POOL_MAX_IDLE handles per URL are kept open for later reads.
+    """
+    with _cog_pool_lock:
+        idle = _cog_pool.setdefault(url, [])
+        src = idle.pop() if idle else None
+    if src is None:
+        import rasterio
+        with rasterio.Env(**COG_ENV_OPTIONS):
+            src = rasterio.open(url)
+    try:
+        yield src
+    finally:
+        with _cog_pool_lock:
+            idle = _cog_pool[url]
+            if len(idle) < _COG_POOL_MAX_IDLE:
+                idle.append(src)
+                src = None
+        if src is not None:
+            src.close()
+
+
+# Source resolution of each year's published canopy figure, for fallback messages
+_NYC_RESOLUTION_LABELS = {2010: "5ft", 2021: "6in"}
+
+# Connections are pooled per process so handlers skip the TCP/TLS/auth handshake
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> psycopg2.pool.ThreadedConnectionPool:
+    """Create the shared connection pool on first use, enabling the PostGIS extensions once."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            new_pool = psycopg2.pool.ThreadedConnectionPool(
+                DATABASE_POOL_CONFIG["min_connections"], DATABASE_POOL_CONFIG["max_connections"], **DATABASE_CONFIG
+            )
+            connection = new_pool.getconn()
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("CREATE EXTENSION IF NOT EXISTS postgis;")
+                    cursor.execute("CREATE EXTENSION IF NOT EXISTS postgis_raster;")
+                connection.commit()
+            except Exception:
+                new_pool.closeall()
+                raise
+            new_pool.putconn(connection)
+            _pool = new_pool
+        return _pool
+
+
+class PoolExhaustedError(Exception):
+    """Every pooled connection stayed checked out for the whole wait timeout."""
+
+
+def _getconn(pool: psycopg2.pool.ThreadedConnectionPool):
+    """
+    Check out a pooled connection, waiting up to the configured timeout for one to free up.
+    ThreadedConnectionPool raises PoolError at once when exhausted, so retry with backoff.
+    """
+    deadline = time.monotonic() + DATABASE_POOL_CONFIG["wait_timeout"]
+    delay = 0.05
+    while True:
+        try:
+            return pool.getconn()
+        except psycopg2.pool.PoolError as e:
+            if pool.closed or time.monotonic() >= deadline:
+                raise PoolExhaustedError(
+                    f"all {DATABASE_POOL_CONFIG['max_connections']} pooled connections busy "
+                    f"for {DATABASE_POOL_CONFIG['wait_timeout']}s"
+                ) from e
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+
+def _connection_alive(connection) -> bool:
+    """Cheap pre-ping so handlers never start work on a dead pooled connection."""
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1;")
+        connection.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _class_counts(data: np.ndarray) -> Tuple[int, int]:
+    """
+    Count valid (non-nodata) and tree pixels in a class raster.
+    A single bincount pass tallies every class at once instead of building
+    and scanning separate masks.
+    """
+    data = np.asarray(data).astype(np.uint8, copy=False)
+    counts = np.bincount(data.ravel(), minlength=3)
+    return int(counts.sum() - counts[0]), int(counts[1] + counts[2])
+
+
+# RGBA per NYC LiDAR land cover class (index = class value, 0 = nodata).
+# Tree Canopy (1) and Grass/Shrubs (2) are the green tree overlay composited
+# over the 70%-opacity base colors; other classes keep their neutral base color.
+_TREE_VISUALIZATION_PALETTE = (
+    (0, 0, 0, 0),            # 0: nodata / outside polygon
+    (31, 89, 54, 240),       # 1: Tree Canopy
+    (26, 90, 57, 240),       # 2: Grass/Shrubs
+    (211, 211, 211, 178),    # 3
+    (165, 42, 42, 178),      # 4
+    (128, 128, 128, 178),    # 5
+    (255, 255, 224, 178),    # 6
+    (211, 211, 211, 178),    # 7+
+)
+# Flattened for Pillow palette-mode PNGs: RGB triples and per-index alpha
+_TREE_VISUALIZATION_PALETTE_RGB = bytes(c for rgba in _TREE_VISUALIZATION_PALETTE for c in rgba[:3])
+_TREE_VISUALIZATION_PALETTE_ALPHA = bytes(rgba[3] for rgba in _TREE_VISUALIZATION_PALETTE)
+
+
+
+def class_png_data_url(data: np.ndarray) -> str:
+    """
+    Encode a class raster as a palette-mode PNG data URL.
+    Class values index straight into the palette, so there is no per-pixel
+    color work; nodata (0) stays transparent.
+    """
+    from PIL import Image
+    from io import BytesIO
+    import base64
+    
+    classes = np.clip(data, 0, len(_TREE_VISUALIZATION_PALETTE) - 1).astype(np.uint8, copy=False)
+    image = Image.fromarray(classes, 'P')
+    image.putpalette(_TREE_VISUALIZATION_PALETTE_RGB)
+    
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', optimize=True, transparency=_TREE_VISUALIZATION_PALETTE_ALPHA)
+    return f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
 
 class PostGISRasterHandler:
     """
@@ -24,29 +173,44 @@ class PostGISRasterHandler:
         self.cursor = None
         
     def connect(self) -> bool:
-        """Establish connection to PostGIS database"""
+        """Check out a live connection to the PostGIS database from the shared pool"""
         try:
-            self.connection = psycopg2.connect(**DATABASE_CONFIG)
+            pool = _get_pool()
+            self.connection = _getconn(pool)
+            if not _connection_alive(self.connection):
+                # Server closed an idle pooled connection; replace it once
+                pool.putconn(self.connection, close=True)
+                self.connection = _getconn(pool)
             self.cursor = self.connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
             
-            # Enable PostGIS and raster extensions
-            self.cursor.execute("CREATE EXTENSION IF NOT EXISTS postgis;")
-            self.cursor.execute("CREATE EXTENSION IF NOT EXISTS postgis_raster;")
-            self.connection.commit()
-            
-            print("✅ Connected to PostGIS database successfully")
             return True
             
+        except PoolExhaustedError as e:
+            # The database is up but this process is saturated; say so rather than "connection failed"
+            self.connection = None
+            print(f"⚠️ Database connection pool exhausted ({e}); raise DATABASE_POOL_MAX_CONNECTIONS if this persists")
+            return False
+            
         except Exception as e:
             print(f"❌ Database connection failed: {e}")
             return False
     
     def disconnect(self):
-        """Close database connection"""
+        """Return the database connection to the pool"""
         if self.cursor:
             self.cursor.close()
+            self.cursor = None
         if self.connection:
-            self.connection.close()
+            # Discard any uncommitted work so the next borrower starts clean;
+            # a connection that cannot roll back is dropped from the pool
+            broken = bool(self.connection.closed)
+            if not broken:
+                try:
+                    self.connection.rollback()
+                except psycopg2.Error:
+                    broken = True
+            _get_pool().putconn(self.connection, close=broken)
+            self.connection = None
     
     def create_raster_table(self, table_name: str) -> bool:
         """Create a raster table for storing metadata and pixel data"""
@@ -60,8 +224,12 @@ class PostGISRasterHandler:
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
             
-            CREATE INDEX IF NOT EXISTS {table_name}_rast_gist_idx 
-            ON {table_name} USING GIST (ST_ConvexHull(rast));
+            -- SP-GiST prunes bbox lookups faster than GiST with a smaller index
+            DROP INDEX IF EXISTS {table_name}_rast_gist_idx;
+            CREATE INDEX IF NOT EXISTS {table_name}_rast_spgist_idx 
+            ON {table_name} USING SPGIST (ST_ConvexHull(rast));
+            
+            ANALYZE {table_name};
             """
             
             self.cursor.execute(create_table_sql)
@@ -118,6 +286,7 @@ class PostGISRasterHandler:
             # This allows multiple polygons/rectangles per year, but prevents duplicates
             try:
                 # Try using md5 hash for bounds_data (more efficient for large JSON)
+                # Cache lookups filter on the same md5 expression so they use this index
                 self.cursor.execute("""
                     DROP INDEX IF EXISTS pixel_cache_year_bounds_unique CASCADE;
                     CREATE UNIQUE INDEX pixel_cache_year_bounds_unique 
@@ -151,6 +320,50 @@ class PostGISRasterHandler:
             traceback.print_exc()
             return False
     
+    def maintain_pixel_cache(self) -> bool:
+        """
+        Cluster pixel_cache on its (year, bounds) index and refresh planner statistics.
+
+        CLUSTER takes an ACCESS EXCLUSIVE lock and rewrites the table, so this is run
+        from the maintenance scripts (initialize_cache.py, migrate_cache.py), never at app startup.
+        """
+        try:
+            # Keep rows physically ordered by (year, bounds) so cache lookups touch
+            # contiguous pages after new areas are cached
+            self.cursor.execute("CLUSTER pixel_cache USING pixel_cache_year_bounds_unique;")
+            self.connection.commit()
+        except Exception as e:
+            self.connection.rollback()
+            print(f"⚠️ Could not cluster pixel cache table: {e}")
+        
+        # Refresh planner statistics so cache lookups use the indexes
+        try:
+            self.cursor.execute("ANALYZE pixel_cache;")
+            self.connection.commit()
+            print("✅ Clustered and analyzed pixel cache table")
+            return True
+        except Exception as e:
+            self.connection.rollback()
+            print(f"⚠️ Could not analyze pixel cache table: {e}")
+            return False
+    
+    def check_pixel_cache_maintenance(self):
+        """Warn if pixel_cache has never been analyzed; a read-only check that is cheap enough for startup."""
+        try:
+            self.cursor.execute("""
+                SELECT COALESCE(last_analyze, last_autoanalyze) AS analyzed_at FROM pg_stat_user_tables
+                WHERE relname = 'pixel_cache';
+            """)
+            row = self.cursor.fetchone()
+            self.connection.commit()
+        except Exception as e:
+            self.connection.rollback()
+            print(f"⚠️ Could not check pixel cache statistics: {e}")
+            return
+        
+        if row is not None and row['analyzed_at'] is None:
+            print("⚠️ pixel_cache has never been analyzed; run 'python initialize_cache.py' to cluster and analyze it")
+    
     def register_cloud_raster(self, year: int, url: str) -> bool:
         """Register a cloud-hosted COG file in PostGIS without downloading"""
         try:
@@ -244,7 +457,7 @@ class PostGISRasterHandler:
             from shapely.geometry import Polygon
             
             try:
-                with rasterio.open(cog_url) as src:
+                with _cog_dataset(cog_url) as src, rasterio.Env(**COG_ENV_OPTIONS):
                     # Handle both rectangle and polygon bounds
                     if bounds.get('type') == 'polygon':
                         # Create polygon from coordinates
@@ -255,8 +468,9 @@ class PostGISRasterHandler:
                         gdf = gpd.GeoDataFrame([1], geometry=[polygon], crs='EPSG:4326')
                         gdf = gdf.to_crs(src.crs)
                         
-                        # Use rasterio.mask to extract polygon data
-                        data, transform = mask(src, gdf.geometry, crop=True, filled=False, nodata=0)
+                        # Use rasterio.mask to extract polygon data; pixels outside the
+                        # polygon are filled with nodata so a plain array comes back
+                        data, transform = mask(src, gdf.geometry, crop=True, filled=True, nodata=0)
                         data = data[0]  # Get first band
                         
                     else:
@@ -275,10 +489,8 @@ class PostGISRasterHandler:
             except Exception as cog_error:
                 print(f"❌ Failed to read COG file: {cog_error}")
                 # Fallback to official NYC data
-                if year == 2010:
-                    return np.array([[21.3]])  # NYC 2010 tree canopy percentage (5ft resolution)
-                elif year == 2021:
-                    return np.array([[22.5]])  # NYC 2021 tree canopy percentage (6in resolution)
+                if year in NYC_TREE_CANOPY_PERCENT:
+                    return np.array([[NYC_TREE_CANOPY_PERCENT[year]]])
                 else:
                     return None
             
@@ -298,33 +510,22 @@ class PostGISRasterHandler:
             # NYC LiDAR 8-class system:
             # 1=Tree Canopy, 2=Grass/Shrubs, 3=Bare Soil, 4=Water, 
             # 5=Buildings, 6=Roads, 7=Other Impervious, 8=Railroads
-            tree_classes = [1, 2]  # Tree Canopy (1) + Grass/Shrubs (2)
-            
-            # Create tree mask
-            tree_mask = np.isin(data, tree_classes)
-            
-            # Calculate coverage percentage
-            total_pixels = np.sum(data > 0)  # Exclude nodata
-            tree_pixels = np.sum(tree_mask)
+            total_pixels, tree_pixels = _class_counts(data)
             
             if total_pixels > 0:
                 coverage = (tree_pixels / total_pixels) * 100
                 return coverage, None
             else:
                 # Return realistic NYC tree coverage percentages based on year
-                if year == 2010:
-                    return 21.3, "Using NYC Tree Canopy Assessment data (5ft resolution)"
-                elif year == 2021:
-                    return 22.5, "Using NYC Tree Canopy Assessment data (6in resolution)"
+                if year in NYC_TREE_CANOPY_PERCENT:
+                    return NYC_TREE_CANOPY_PERCENT[year], f"Using NYC Tree Canopy Assessment data ({_NYC_RESOLUTION_LABELS[year]} resolution)"
                 else:
                     return 0.0, "No valid pixels found"
                 
         except Exception as e:
             # Fallback to official NYC data
-            if year == 2010:
-                return 21.3, f"Fallback to NYC data (5ft): {str(e)}"
-            elif year == 2021:
-                return 22.5, f"Fallback to NYC data (6in): {str(e)}"
+            if year in NYC_TREE_CANOPY_PERCENT:
+                return NYC_TREE_CANOPY_PERCENT[year], f"Fallback to NYC data ({_NYC_RESOLUTION_LABELS[year]}): {str(e)}"
             else:
                 return 0.0, str(e)
     
@@ -337,7 +538,7 @@ class PostGISRasterHandler:
             
             check_sql = """
             SELECT id FROM pixel_cache 
-            WHERE year = %s AND bounds_type = %s AND bounds_data::text = %s
+            WHERE year = %s AND bounds_type = %s AND md5(COALESCE(bounds_data, '')) = md5(%s)
             """
             self.cursor.execute(check_sql, (year, bounds_type, bounds_json))
             
@@ -353,12 +554,13 @@ class PostGISRasterHandler:
                 print(f"❌ No data to cache for year {year}")
                 return False
             
+            # Class codes fit in a byte; store them as uint8 so the blob is as small
+            # as possible and matches the dtype get_cached_pixel_data decodes with
+            data = data.astype(np.uint8, copy=False)
+            
             # Calculate statistics
             # NYC LiDAR: 1=Tree Canopy, 2=Grass/Shrubs
-            tree_classes = [1, 2]  # Tree Canopy + Grass/Shrubs
-            tree_mask = np.isin(data, tree_classes)
-            total_pixels = int(np.sum(data > 0))
-            tree_pixels = int(np.sum(tree_mask))
+            total_pixels, tree_pixels = _class_counts(data)
             coverage = (tree_pixels / total_pixels * 100) if total_pixels > 0 else 0.0
             
             # Generate visualization image
@@ -377,7 +579,7 @@ class PostGISRasterHandler:
             # Check if entry exists with same year and bounds
             check_sql = """
             SELECT id FROM pixel_cache 
-            WHERE year = %s AND bounds_data::text = %s
+            WHERE year = %s AND md5(COALESCE(bounds_data, '')) = md5(%s)
             """
             self.cursor.execute(check_sql, (year, bounds_json))
             existing = self.cursor.fetchone()
@@ -395,7 +597,7 @@ class PostGISRasterHandler:
                     visualization_image = %s,
                     geo_bounds = %s,
                     created_at = CURRENT_TIMESTAMP
-                WHERE year = %s AND bounds_data::text = %s
+                WHERE year = %s AND md5(COALESCE(bounds_data, '')) = md5(%s)
                 """
                 self.cursor.execute(update_sql, (
                     compressed_data,
@@ -445,7 +647,7 @@ class PostGISRasterHandler:
                             visualization_image = %s,
                             geo_bounds = %s,
                             created_at = CURRENT_TIMESTAMP
-                        WHERE year = %s AND bounds_data::text = %s
+                        WHERE year = %s AND md5(COALESCE(bounds_data, '')) = md5(%s)
                         """
                         self.cursor.execute(update_sql, (
                             compressed_data,
@@ -475,11 +677,6 @@ class PostGISRasterHandler:
     
     def _create_visualization_image(self, data: np.ndarray, bounds: Dict[str, Any]) -> Tuple[str, list]:
         """Create visualization image from pixel data"""
-        import matplotlib.pyplot as plt
-        import matplotlib.colors as mcolors
-        from io import BytesIO
-        import base64
-        
         # Calculate geo_bounds
         if bounds.get('type') == 'polygon':
             coords = bounds['coordinates']
@@ -489,39 +686,7 @@ class PostGISRasterHandler:
         else:
             geo_bounds = [[bounds['south'], bounds['west']], [bounds['north'], bounds['east']]]
         
-        # Create tree mask - NYC LiDAR: 1=Tree Canopy, 2=Grass/Shrubs
-        tree_mask = np.isin(data, [1, 2])
-        
-        # Create visualization
-        fig, ax = plt.subplots(figsize=(10, 10), dpi=150)
-        
-        # Mask out nodata values
-        valid_data_mask = data != 0
-        
-        # Display original data with neutral colormap
-        colors_original = ['white', 'lightgray', 'lightblue', 'lightgray', 'brown', 'gray', 'lightyellow', 'lightgray']
-        cmap_original = mcolors.ListedColormap(colors_original)
-        masked_data = np.ma.masked_where(~valid_data_mask, data)
-        ax.imshow(masked_data, cmap=cmap_original, vmin=0, vmax=7, alpha=0.7, aspect='equal')
-        
-        # Overlay tree areas in green
-        tree_overlay = np.ma.masked_where(~(tree_mask & valid_data_mask), tree_mask)
-        ax.imshow(tree_overlay, cmap='Greens', alpha=0.8, vmin=0, vmax=1, aspect='equal')
-        
-        ax.axis('off')
-        plt.tight_layout(pad=0)
-        
-        # Save to bytes
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight', pad_inches=0,
-                   facecolor='none', edgecolor='none', transparent=True)
-        buffer.seek(0)
-        
-        # Convert to base64
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
-        plt.close()
-        
-        return f"data:image/png;base64,{image_base64}", geo_bounds
+        return class_png_data_url(data), geo_bounds
     
     def get_cached_pixel_data(self, year: int, bounds: Optional[Dict[str, Any]] = None, bounds_type: str = None) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
         """Retrieve cached pixel data from database
@@ -547,7 +712,7 @@ class PostGISRasterHandler:
                 SELECT pixel_data, data_shape, bounds_data, total_pixels, tree_pixels, coverage_percent,
                        visualization_image, geo_bounds
                 FROM pixel_cache
-                WHERE year = %s AND bounds_type = %s AND bounds_data::text = %s
+                WHERE year = %s AND bounds_type = %s AND md5(COALESCE(bounds_data, '')) = md5(%s)
                 """
                 self.cursor.execute(select_sql, (year, bounds_type, bounds_json))
             else:
@@ -599,7 +764,6 @@ class PostGISRasterHandler:
                 'geo_bounds': json.loads(result['geo_bounds']) if result['geo_bounds'] else None
             }
             
-            print(f"✅ Retrieved cached pixel data for year {year}: {data.shape}")
             return data, metadata
             
         except Exception as e:
@@ -608,6 +772,39 @@ class PostGISRasterHandler:
             traceback.print_exc()
             return None
     
+    def get_cached_coverage(self, year: int, bounds: Dict[str, Any]) -> Optional[float]:
+        """Retrieve only the cached coverage percentage for an area
+        
+        Unlike get_cached_pixel_data this does not transfer or decompress the
+        pixel blob and visualization image, so coverage lookups stay one small row.
+        """
+        try:
+            bounds_type = bounds.get('type', 'rectangle')
+            bounds_json = json.dumps(bounds, sort_keys=True)
+            select_sql = """
+            SELECT coverage_percent, bounds_data
+            FROM pixel_cache
+            WHERE year = %s AND bounds_type = %s AND md5(COALESCE(bounds_data, '')) = md5(%s)
+            LIMIT 1
+            """
+            self.cursor.execute(select_sql, (year, bounds_type, bounds_json))
+            result = self.cursor.fetchone()
+            
+            if not result:
+                return None
+            
+            cached_bounds = result['bounds_data']
+            if isinstance(cached_bounds, str):
+                cached_bounds = json.loads(cached_bounds)
+            if not self._bounds_match(bounds, cached_bounds):
+                return None
+            
+            return result['coverage_percent']
+            
+        except Exception as e:
+            print(f"❌ Failed to retrieve cached coverage: {e}")
+            return None
+    
     def _bounds_match(self, bounds1: Dict[str, Any], bounds2: Dict[str, Any]) -> bool:
         """Check if two bounds dictionaries match (within tolerance for floating point)"""
         try:
@@ -719,6 +916,9 @@ def initialize_lidar_datasets() -> bool:
             if not handler.cache_pixel_data(year, HUDSON_SQUARE_BOUNDS):
                 print(f"⚠️ Could not cache pixel data for {year}, will read from COG on demand")
         
+        # CLUSTER/ANALYZE lock and rewrite the table, so startup only checks for them
+        handler.check_pixel_cache_maintenance()
+        
         return success
         
     finally:
@@ -732,9 +932,6 @@ def get_tree_coverage_postgis(year: int, bounds: Optional[Dict[str, Any]] = None
         bounds: Optional bounds dict (polygon or rectangle). If None, uses HUDSON_SQUARE_BOUNDS
     """
     try:
-        from config import LIDAR_DATASETS, HUDSON_SQUARE_BOUNDS
-        import numpy as np
-        
         # Use provided bounds or fall back to default
         active_bounds = bounds if bounds is not None else HUDSON_SQUARE_BOUNDS
         
@@ -743,12 +940,9 @@ def get_tree_coverage_postgis(year: int, bounds: Optional[Dict[str, Any]] = None
         handler = PostGISRasterHandler()
         if handler.connect():
             try:
-                cached_result = handler.get_cached_pixel_data(year, active_bounds)
+                coverage = handler.get_cached_coverage(year, active_bounds)
                 
-                if cached_result:
-                    data, metadata = cached_result
-                    coverage = metadata['coverage_percent']
-                    print(f"⚡ Using cached pixel data for {year}: {coverage:.2f}%")
+                if coverage is not None:
                     handler.disconnect()
                     return coverage, None
                 else:
@@ -769,83 +963,69 @@ def get_tree_coverage_postgis(year: int, bounds: Optional[Dict[str, Any]] = None
         
         print(f"🔍 Reading from COG file for drawn area: {cog_url}")
         
-        # Add headers to avoid 403 errors
         import rasterio
-        import rasterio.session
         from rasterio.warp import transform_bounds
         
-        session = rasterio.session.AWSSession(
-            aws_access_key_id=None,
-            aws_secret_access_key=None,
-            region_name=None,
-            requester_pays=False,
-            session=None,
-            endpoint_url=None,
-            aws_unsigned=True
-        )
-        
-        with rasterio.Env(session=session):
-            with rasterio.open(cog_url) as src:
-                # Handle polygon masking for accurate tree coverage
-                if active_bounds.get('type') == 'polygon':
-                    from rasterio.mask import mask
-                    import geopandas as gpd
-                    from shapely.geometry import Polygon
-                    
-                    # Create polygon from coordinates
-                    coords = active_bounds['coordinates']
-                    polygon = Polygon(coords)
-                    
-                    # Create GeoDataFrame
-                    gdf = gpd.GeoDataFrame([1], geometry=[polygon], crs='EPSG:4326')
-                    gdf = gdf.to_crs(src.crs)
-                    
-                    # Use rasterio.mask to extract polygon data
-                    # filled=False keeps nodata, crop=True crops to bounding box
-                    data, transform = mask(src, gdf.geometry, crop=True, filled=False, nodata=0)
-                    data = data[0]  # Get first band
-                    
-                else:
-                    # Rectangle bounds
-                    if 'west' in active_bounds:
-                        raster_bounds = transform_bounds('EPSG:4326', src.crs, 
-                                                       active_bounds['west'], active_bounds['south'],
-                                                       active_bounds['east'], active_bounds['north'])
-                    else:
-                        bounds_rect = get_study_area_bounds()
-                        raster_bounds = transform_bounds('EPSG:4326', src.crs, 
-                                                       bounds_rect['west'], bounds_rect['south'],
-                                                       bounds_rect['east'], bounds_rect['north'])
-                    
-                    window = rasterio.windows.from_bounds(*raster_bounds, src.transform)
-                    data = src.read(1, window=window)
+        # The COGs are public HTTPS objects; these options keep GDAL to ranged
+        # reads of the header and the tiles under the window
+        with _cog_dataset(cog_url) as src, rasterio.Env(**COG_ENV_OPTIONS):
+            # Handle polygon masking for accurate tree coverage
+            if active_bounds.get('type') == 'polygon':
+                from rasterio.mask import mask
+                import geopandas as gpd
+                from shapely.geometry import Polygon
                 
-                print(f"✅ Successfully read {data.shape} pixels from COG file")
+                # Create polygon from coordinates
+                coords = active_bounds['coordinates']
+                polygon = Polygon(coords)
                 
-                # Apply tree classification - NYC LiDAR 8-class system
-                tree_classes = [1, 2]  # Tree Canopy (1) + Grass/Shrubs (2)
-                tree_mask = np.isin(data, tree_classes)
+                # Create GeoDataFrame
+                gdf = gpd.GeoDataFrame([1], geometry=[polygon], crs='EPSG:4326')
+                gdf = gdf.to_crs(src.crs)
                 
-                total_pixels = np.sum(data > 0)
-                tree_pixels = np.sum(tree_mask)
+                # Use rasterio.mask to extract polygon data
+                # filled=True writes nodata outside the polygon (a plain array,
+                # no MaskedArray), crop=True crops to bounding box
+                data, transform = mask(src, gdf.geometry, crop=True, filled=True, nodata=0)
+                data = data[0]  # Get first band
                 
-                if total_pixels > 0:
-                    coverage = (tree_pixels / total_pixels) * 100
-                    
-                    # Cache this data for next time (with current bounds)
-                    if handler.connect():
-                        try:
-                            handler.cache_pixel_data(year, active_bounds)
-                            print(f"✅ Cached pixel data for future use")
-                        except:
-                            pass
-                        finally:
-                            handler.disconnect()
-                    
-                    return coverage, None  # No error message for successful COG access
+            else:
+                # Rectangle bounds
+                if 'west' in active_bounds:
+                    raster_bounds = transform_bounds('EPSG:4326', src.crs, 
+                                                   active_bounds['west'], active_bounds['south'],
+                                                   active_bounds['east'], active_bounds['north'])
                 else:
-                    return 0.0, "No valid pixels found"
+                    bounds_rect = get_study_area_bounds()
+                    raster_bounds = transform_bounds('EPSG:4326', src.crs, 
+                                                   bounds_rect['west'], bounds_rect['south'],
+                                                   bounds_rect['east'], bounds_rect['north'])
                 
+                window = rasterio.windows.from_bounds(*raster_bounds, src.transform)
+                data = src.read(1, window=window, out_dtype='uint8')
+        
+        print(f"✅ Successfully read {data.shape} pixels from COG file")
+        
+        # Apply tree classification - NYC LiDAR 8-class system
+        total_pixels, tree_pixels = _class_counts(data)
+        
+        if total_pixels > 0:
+            coverage = (tree_pixels / total_pixels) * 100
+            
+            # Cache this data for next time (with current bounds)
+            if handler.connect():
+                try:
+                    handler.cache_pixel_data(year, active_bounds)
+                    print(f"✅ Cached pixel data for future use")
+                except:
+                    pass
+                finally:
+                    handler.disconnect()
+            
+            return coverage, None  # No error message for successful COG access
+        else:
+            return 0.0, "No valid pixels found"
+        
     except Exception as e:
         print(f"❌ Error accessing data for {year}: {e}")
         return 0.0, f"Data access failed: {str(e)}"